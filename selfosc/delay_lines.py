@@ -1,8 +1,14 @@
 
 import numpy as np
 
+def next_pow2(n):
+    """
+    smallest power of two greater or equal to n
+    """
+    return 1 << int(np.ceil(np.log2(max(n, 1))))
+
 class DelayLine(object):
-    def __init__(self, delay=1, extra=1):
+    def __init__(self, delay=1, extra=1, dtype=np.float32):
         """
         initalise a delay line with maximum delay "delay"
 
@@ -13,10 +19,20 @@ class DelayLine(object):
         extra : int
                 Extra samples to include
                 ( for example if a filter is to be included)
+        dtype : numpy dtype
+                type of the samples (float32 by default)
+
+        The total length of the line is rounded up to a power of two
+        so that the pointer can be wrapped with a bit mask
+
+        Every sample is stored twice, at ptr and ptr+n_samp, so that
+        any n_samp consecutive samples can be read as a single slice
         """
         # n_samp is the total number of samples to be kept in mem
-        n_samp = delay + extra
-        self.line = np.zeros(n_samp)
+        n_samp = next_pow2(delay + extra)
+        self.mask = n_samp - 1
+        # line holds two copies of the samples
+        self.line = np.zeros(2*n_samp, dtype=dtype)
         # ptr points to the last inserted sample
         self.ptr = 0
         self.n_samp = n_samp
@@ -29,20 +45,23 @@ class DelayLine(object):
         """
         increase the pointer by one sample
 
-        Should not be called by user, 'insert_sample' calls this
+        Should not be called by user
+        ('insert_sample' does the same inline)
         """
-        self.ptr += 1
-        if self.ptr > len(self.line)-1:
-            self.ptr = 0
+        self.ptr = (self.ptr + 1) & self.mask
         self.nticks += 1
 
     def insert_sample(self, sin):
         """
         Inserts one sample and advances pointer
         """
-        #self.line[(self.ptr+1)%self.n_samp] = sin
-        self.increase_ptr()
-        self.line[self.ptr] = sin
+        # same as increase_ptr, with a single read of ptr
+        ptr = (self.ptr + 1) & self.mask
+        line = self.line
+        line[ptr] = sin
+        line[ptr+self.n_samp] = sin
+        self.ptr = ptr
+        self.nticks += 1
 
     def read_delay(self, delay=None):
         """
@@ -57,15 +76,108 @@ class DelayLine(object):
         """
         if delay is None:
             delay = self.delay
-        return self.line[(self.ptr-delay)%self.n_samp]
+        return self.line[(self.ptr-delay) & self.mask]
+
+    def insert_block(self, x):
+        """
+        Inserts a block of samples and advances pointer
+        by the number of samples
+
+        Equivalent to calling insert_sample for each element of x
+
+        Parameters
+        ----------
+
+        x : array of floats
+            samples to insert, oldest first
+        """
+        x = np.asarray(x)
+        nx = len(x)
+        n_samp = self.n_samp
+        ptr = self.ptr
+        self.nticks += nx
+        if nx > n_samp:
+            # only the last n_samp samples are kept
+            ptr = (ptr + nx - n_samp) & self.mask
+            x = x[nx-n_samp:]
+            nx = n_samp
+        start = ptr + 1
+        np.copyto(self.line[start:start+nx], x)
+        # copy to the other half of the line: the first n_head samples
+        # fall in the first half, the rest in the second half
+        n_head = min(nx, n_samp - start)
+        np.copyto(self.line[start+n_samp:start+n_samp+n_head], x[:n_head])
+        np.copyto(self.line[start+n_head-n_samp:start+nx-n_samp], x[n_head:])
+        self.ptr = (ptr + nx) & self.mask
 
-    def dump_line(self):
+    def read_block_delay(self, delay=None, n=1):
+        """
+        Read the samples that will be at a given delay from
+        the pointer during the next n samples
+
+        Equivalent to calling read_delay(delay) n times,
+        each followed by one call to insert_sample.
+
+        Parameters
+        ----------
+
+        delay : int
+                read at delay samples from current pointer
+                By default this is the maximum delay defined at init
+        n : int
+            number of samples to read, at most delay+1
+
+        Returns
+        -------
+
+        array of n samples, oldest first
+        """
+        if delay is None:
+            delay = self.delay
+        start = (self.ptr - delay) & self.mask
+        return self.line[start:start+n].copy()
+
+    def dump_line(self, n=None, out=None):
         """
         Read the entire delay line from current sample to maximum delay
+
+        Parameters
+        ----------
+
+        n : int
+            number of samples to read, at most n_samp
+            (by default the maximum delay, or the length of out)
+        out : array of floats
+              if given, samples are written in this array
+              instead of a new one
+
+        Returns
+        -------
+
+        array of n samples, element k is the sample at delay k
         """
-        rolled_line = np.roll(np.flipud(self.line), self.ptr+1)
-        return (rolled_line)[:self.delay]
+        if n is None:
+            n = self.delay if out is None else len(out)
+        if n > self.n_samp:
+            raise ValueError('can not read {} samples from a line of {} '
+                             'samples'.format(n, self.n_samp))
+        if out is None:
+            out = np.empty(n, dtype=self.line.dtype)
+        # samples from ptr+n_samp backwards, in the second copy
+        stop = self.ptr + self.n_samp
+        out[:n] = self.line[stop:stop-n:-1]
+        return out
 
-    def __getitem__(self, index):
-        return self.line[index]
+    @property
+    def buffer(self):
+        """
+        The array holding the samples (no copy)
 
+        Holds two copies of the line: sample at delay d is at
+        buffer[ptr-d+n_samp] (and at buffer[(ptr-d) & mask]).
+        The array is never reallocated by the DelayLine, so it can
+        be kept by compiled code. For the delay lines of a
+        TubeAssembly it is a view into the assembly buffers,
+        which are rebuilt when a tube is appended.
+        """
+        return self.line
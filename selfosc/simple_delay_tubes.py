@@ -4,10 +4,123 @@
   provides simple delay lines that can be plugged together
 """
 
+from collections.abc import Sequence
+
 import numpy as np
 
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit when numba is not installed:
+        kernels are run as plain python functions
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 from .delay_lines import DelayLine
 
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _read_exit(bufs, ptrs, delays, masks, index):
+    """
+    Read the sample at the exit of the line in row index of bufs
+    (see Tube.read_outgoing). The sample is not attenuated: the
+    losses are included in the junction coefficients
+    """
+    # same "-2" correction as in Tube.read_outgoing
+    return bufs[index, (ptrs[index] - delays[index] + 2) & masks[index]]
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _push(bufs, ptrs, masks, index, val):
+    """
+    Insert a sample in the line in row index of bufs
+    and advance its pointer (see DelayLine.insert_sample)
+    """
+    mask = masks[index]
+    ptr = (ptrs[index] + 1) & mask
+    bufs[index, ptr] = val
+    # second copy of the line (see DelayLine)
+    bufs[index, ptr + mask + 1] = val
+    ptrs[index] = ptr
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _scatter(s00, s01, s10, s11, outgoing_val, incoming_val):
+    """
+    Scattering junction with matrix [[s00, s01], [s10, s11]]
+    (see TubeAssembly.scatter)
+
+    Returns
+    -------
+    outgoing (into right) and incoming (into left) values
+    """
+    return (incoming_val*s01 + outgoing_val*s00,
+            incoming_val*s11 + outgoing_val*s10)
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _step(bufs_in, bufs_out, ptrs_in, ptrs_out, delays, masks,
+          c00, c01, c10, c11, val, ret_val):
+    """
+    Advance all the tubes of an assembly by one sample
+
+    Works on the delay line buffers of a TubeAssembly
+    (see TubeAssembly._build_state). Same algorithm as
+    TubeAssembly._insert_values_py, but the propagation losses are
+    applied by the junction coefficients c00 to c11
+
+    Returns
+    -------
+    outgoing value from the radiative end
+    """
+    last = ptrs_in.shape[0] - 1
+    prev_prout = val
+    for ii in range(last):
+        plout = _read_exit(bufs_out, ptrs_out, delays, masks, ii)
+        prin = _read_exit(bufs_in, ptrs_in, delays, masks, ii+1)
+        prout, plin = _scatter(c00[ii], c01[ii], c10[ii], c11[ii],
+                               plout, prin)
+        _push(bufs_in, ptrs_in, masks, ii, plin)
+        _push(bufs_out, ptrs_out, masks, ii, prev_prout)
+        prev_prout = prout
+    # last element
+    plout = _read_exit(bufs_out, ptrs_out, delays, masks, last)
+    prin = ret_val
+    prout, plin = _scatter(c00[last], c01[last], c10[last], c11[last],
+                           plout, prin)
+    _push(bufs_in, ptrs_in, masks, last, plin)
+    _push(bufs_out, ptrs_out, masks, last, prev_prout)
+    return prout
+
+
+@njit(cache=True, fastmath=True, nogil=True, boundscheck=False)
+def _run(bufs_in, bufs_out, ptrs_in, ptrs_out, delays, masks,
+         c00, c01, c10, c11, signal, ret_signal, out):
+    """
+    Run _step for every sample in signal and ret_signal,
+    storing the radiated values in out
+    """
+    for ii in range(signal.shape[0]):
+        out[ii] = _step(bufs_in, bufs_out, ptrs_in, ptrs_out, delays, masks,
+                        c00, c01, c10, c11, signal[ii], ret_signal[ii])
+
+
+def _read_only_matrix(matrix):
+    """
+    Copy of matrix as a float array that can not be modified
+    """
+    matrix = np.array(matrix, dtype=np.float64)
+    matrix.flags.writeable = False
+    return matrix
+
+
 class Tube(object):
     """
     Class for a straight tube described by a single pair of delay lines
@@ -24,25 +137,63 @@ class Tube(object):
     ----------
     delay : int
             the delay of the tube from one end to the other
-            (proportional to the length of the tube)
+            (proportional to the length of the tube), at least 2
 
     losses : float
              Each sample propagation losses a small fraction of
              its amplitude
+
+    dtype : numpy dtype
+            type of the samples in the delay lines (float32 by default)
     """
-    def __init__(self, delay=1, losses=0.):
+    def __init__(self, delay=2, losses=0., dtype=np.float32):
+        # the exit of the lines is read at delay-2 (see read_outgoing),
+        # which would wrap around the line for shorter tubes
+        if delay < 2:
+            raise ValueError('tube delay must be at least 2 samples, '
+                             'got {}'.format(delay))
         self.extra = 5
-        self.dlin = DelayLine(delay, extra=self.extra)
-        self.dlout = DelayLine(delay, extra=self.extra)
+        self.dtype = np.dtype(dtype)
+        self.dlin = DelayLine(delay, extra=self.extra, dtype=dtype)
+        self.dlout = DelayLine(delay, extra=self.extra, dtype=dtype)
         # scattering matrix (unused?)
         self.scat = None
         self.tube_l = None
         self.tube_r = None
         self.delay = delay
         # Attenuation for the entire delay line
-        self.prop_mult = (1-losses)**delay
+        self.prop_mult = self.dtype.type((1-losses)**delay)
         # Attenuation for a single sample
         self.smpl_prop_mult = 1-losses
+        # Attenuation after 0 to delay samples
+        # (losses are fixed, so this is never recalculated)
+        self._pmults = (self.smpl_prop_mult**np.arange(delay+1)
+                        ).astype(dtype)
+        # work space for write_sum_distribution
+        self._sum_work = np.zeros(delay+1, dtype=dtype)
+        # TubeAssembly holding the tube, row of the tube in its buffers
+        # and its kernel tick count when the pointers were last synced
+        # (see _sync_ptrs)
+        self._assembly = None
+        self._index = None
+        self._kernel_ticks = 0
+
+    def _sync_ptrs(self, writing=False):
+        """
+        Bring the pointers of the delay lines up to date
+
+        In a TubeAssembly the compiled kernels advance the pointers
+        kept by the assembly, which are only copied back here, when
+        the tube is accessed. Before a write the assembly is told
+        that its pointers are outdated.
+        """
+        assembly = self._assembly
+        if assembly is None:
+            return
+        if self._kernel_ticks != assembly._kernel_ticks:
+            assembly._store_ptrs(self._index)
+        if writing:
+            assembly._ptrs_stale = True
 
     def insert_incoming_sample(self, sin):
         """
@@ -53,6 +204,7 @@ class Tube(object):
         sin : float
               New sample
         """
+        self._sync_ptrs(writing=True)
         self.dlin.insert_sample(sin)
 
     def insert_outgoing_sample(self, sin):
@@ -64,6 +216,7 @@ class Tube(object):
         sin : float
               New sample
         """
+        self._sync_ptrs(writing=True)
         self.dlout.insert_sample(sin)
 
     def read_outgoing(self):
@@ -75,6 +228,7 @@ class Tube(object):
         ----------
         None
         """
+        self._sync_ptrs()
         # This should be the out delay, -2 is some weird correction
         return self.dlout.read_delay(self.dlout.delay-2)*self.prop_mult
 
@@ -87,23 +241,59 @@ class Tube(object):
         ----------
         None
         """
+        self._sync_ptrs()
         # This should be the in delay, -2 is some weird correction
         return self.dlin.read_delay(self.dlin.delay-2)*self.prop_mult
 
-    def read_samples(self):
+    def read_both_exit(self):
+        """
+        Reads one sample from each delay line at its exit point
+        Samples are attenuated according to the tube losses
+
+        Same as (read_outgoing(), read_incoming()), with a single
+        method call
+
+        Returns
+        -------
+        outgoing_sample, incoming_sample
+        """
+        self._sync_ptrs()
+        return self._read_both_exit()
+
+    def _read_both_exit(self):
+        """
+        read_both_exit, without bringing the pointers up to date
+        """
+        dlout = self.dlout
+        dlin = self.dlin
+        mult = self.prop_mult
+        # -2 is the same correction as in read_outgoing
+        return (dlout.line[(dlout.ptr - dlout.delay + 2) & dlout.mask]*mult,
+                dlin.line[(dlin.ptr - dlin.delay + 2) & dlin.mask]*mult)
+
+    def read_samples(self, n=None):
         """
         Reads samples from both delay lines at their exit points
         Samples are attenuated according to the tube losses
 
         Parameters
         ----------
-        None
+        n : int or None
+            if given, read the n samples that will reach the exit points
+            during the next n ticks (at most delay-1)
 
         Returns
         -------
         outgoing_sample, incoming_sample
+        (arrays of n samples if n is given)
         """
-        return self.read_outgoing(), self.read_incoming()
+        if n is None:
+            return self.read_both_exit()
+        self._sync_ptrs()
+        return (self.dlout.read_block_delay(self.dlout.delay-2, n) *
+                self.prop_mult,
+                self.dlin.read_block_delay(self.dlin.delay-2, n) *
+                self.prop_mult)
 
     def read_incoming_at_pos(self, index):
         """
@@ -114,7 +304,9 @@ class Tube(object):
         index : int
                 distance in samples from input of the tube
         """
-        return self.dlin.read_delay(self.delay-index)*(self.smpl_prop_mult)**(self.delay-index)
+        self._sync_ptrs()
+        return (self.dlin.read_delay(self.delay-index) *
+                self._pmults[self.delay-index])
 
     def read_outgoing_at_pos(self, index):
         """
@@ -125,7 +317,8 @@ class Tube(object):
         index : int
                 distance in samples from input of the tube
         """
-        return self.dlout.read_delay(index)*(self.smpl_prop_mult)**(index)
+        self._sync_ptrs()
+        return self.dlout.read_delay(index)*self._pmults[index]
 
     def get_sum_at_pos(self, index):
         """
@@ -151,6 +344,7 @@ class Tube(object):
         index : int
                 distance in samples from input of the tube
         """
+        self._sync_ptrs()
         pini = self.dlin.read_delay(self.delay-index)
         pouti = self.dlout.read_delay(index)
         return -pini + pouti
@@ -167,10 +361,119 @@ class Tube(object):
         ------
         vector with pressure (index 0 == tube input)
         """
-        pmults = self.smpl_prop_mult**np.arange(self.delay+1)
-        pout = np.array(self.dlout.dump_line())*pmults
-        pin = np.flipud(np.array(self.dlin.dump_line())*pmults)
-        return pout+pin
+        ps = np.zeros(self.delay+1, dtype=self.dtype)
+        self.write_sum_distribution(ps)
+        return ps
+
+    def write_sum_distribution(self, out):
+        """
+        Adds the sum (pressure) in the entire tube to an array,
+        without allocating new arrays
+
+        Parameters
+        ----------
+        out : array of floats
+              array of length delay+1 (index 0 == tube input)
+        """
+        self._sync_ptrs()
+        work = self._sum_work
+        self.dlout.dump_line(out=work)
+        work *= self._pmults
+        out += work
+        self.dlin.dump_line(out=work)
+        work *= self._pmults
+        out += work[::-1]
+
+
+class _Arena(object):
+    """
+    Single block of memory holding the state of a TubeAssembly,
+    aligned on cache lines
+
+    The block holds, in this order:
+
+    state : one record of 64 bytes (a cache line) per tube, with
+            the pointers, delay, mask, junction coefficients
+            (scattering matrix times losses) and attenuation of the tube
+    bufs_in, bufs_out : 2-D arrays with one delay line per row
+    att : 2-D array with one attenuation table per row
+
+    Each part and each row starts on a cache line
+
+    Parameters
+    ----------
+    ntubes : int
+             number of tubes
+    width : int
+            minimum length of a delay line row
+    natt : int
+           minimum length of an attenuation table row
+    dtype : numpy dtype
+            type of the samples
+    """
+    align = 64
+
+    def __init__(self, ntubes, width, natt, dtype=np.float32):
+        dtype = np.dtype(dtype)
+        fields = [('ptr_in', np.int32), ('ptr_out', np.int32),
+                  ('delay', np.int32), ('mask', np.int32),
+                  ('c00', dtype), ('c01', dtype),
+                  ('c10', dtype), ('c11', dtype),
+                  ('prop_mult', dtype)]
+        packed = np.dtype(fields, align=True)
+        assert packed.itemsize <= self.align
+        state_dtype = np.dtype({'names': packed.names,
+                                'formats': [packed.fields[name][0]
+                                            for name in packed.names],
+                                'offsets': [packed.fields[name][1]
+                                            for name in packed.names],
+                                'itemsize': self.align})
+        width = self._round_up(width*dtype.itemsize)//dtype.itemsize
+        natt = self._round_up(natt*dtype.itemsize)//dtype.itemsize
+        sizes = [ntubes*state_dtype.itemsize,
+                 ntubes*width*dtype.itemsize,
+                 ntubes*width*dtype.itemsize,
+                 ntubes*natt*dtype.itemsize]
+        raw = np.zeros(sum(sizes) + self.align, dtype=np.uint8)
+        offset = -raw.ctypes.data % self.align
+        parts = []
+        for size in sizes:
+            parts.append(raw[offset:offset+size])
+            offset += size
+        self.state = parts[0].view(state_dtype)
+        self.bufs_in = parts[1].view(dtype).reshape(ntubes, width)
+        self.bufs_out = parts[2].view(dtype).reshape(ntubes, width)
+        self.att = parts[3].view(dtype).reshape(ntubes, natt)
+
+    def _round_up(self, nbytes):
+        """
+        round up a number of bytes to a multiple of the alignment
+        """
+        return -(-nbytes // self.align) * self.align
+
+
+class _ScatteringMatrices(Sequence):
+    """
+    Sequence of the scattering matrices of a TubeAssembly
+    (see TubeAssembly.scats)
+
+    The matrices can not be modified in place, but assigning a new
+    matrix to an item calls TubeAssembly.set_scattering
+    """
+    def __init__(self, assembly):
+        self._assembly = assembly
+
+    def __len__(self):
+        return len(self._assembly._scats)
+
+    def __getitem__(self, index):
+        return self._assembly._scats[index]
+
+    def __setitem__(self, index, matrix):
+        self._assembly.set_scattering(index, matrix)
+
+    def __repr__(self):
+        return repr(self._assembly._scats)
 
 
 class TubeAssembly(object):
@@ -182,7 +485,8 @@ class TubeAssembly(object):
 
     Parameters
     ----------
-    None
+    dtype : numpy dtype
+            type of the samples in the delay lines (float32 by default)
 
     Example
     -------
@@ -192,12 +496,14 @@ class TubeAssembly(object):
     Creates the tube assembly instance and adds one tube
     """
 
-    def __init__(self):
+    def __init__(self, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
         self.tubes = []
-        self.scats = []
+        self._scats = []
         self.radii = []
+        self._build_state()
 
-    def append_tube(self, delay=1, radius=1., losses=0.):
+    def append_tube(self, delay=2, radius=1., losses=0.):
         """
         Appends one tube to the tube assembly at the end of the last tube
 
@@ -205,19 +511,184 @@ class TubeAssembly(object):
         ----------
 
         delay : int
-                Tube length in samples
+                Tube length in samples (at least 2)
         radius : float
                  tube radius (only relative units are relevant)
         losses : float
                  fraction of the amplitude that is lost per sample in the tube
 
         """
-        self.tubes.append(Tube(delay=delay, losses=losses))
+        self.tubes.append(Tube(delay=delay, losses=losses, dtype=self.dtype))
         # default scattering junction: perfect open pipe
-        self.scats.append(np.array([[0, 1], [-1, 0]]))
+        self._scats.append(_read_only_matrix([[0, 1], [-1, 0]]))
         self.radii.append(radius)
+        self._build_state()
         self.connect_tubes()
 
+    @property
+    def scats(self):
+        """
+        Scattering matrices of each junction
+
+        scats[i] is the junction at the end of tube i, the last one
+        being the radiative end. The matrices are read-only:
+        scats[i] = matrix is the same as set_scattering(i, matrix)
+        """
+        return _ScatteringMatrices(self)
+
+    def set_scattering(self, index, matrix):
+        """
+        Sets the scattering matrix of a junction
+
+        Parameters
+        ----------
+
+        index : int
+                index of the tube at whose end the junction is
+                (-1 for the radiative end)
+        matrix : 2x2 array
+                 scattering matrix [[s00, s01], [s10, s11]]
+                 (see scatter())
+        """
+        if index < 0:
+            index = len(self.tubes)+index
+        self._scats[index] = _read_only_matrix(matrix)
+        self._set_scat_coefs(index)
+
+    def _build_state(self):
+        """
+        Gather the state of all tubes into a single aligned block
+        of memory (see _Arena) that can be passed to the compiled kernels:
+        two 2-D delay line buffers (bufs_in and bufs_out, one row per
+        tube), a record of pointers, delays, masks, scattering
+        coefficients and attenuation per tube, and the attenuation tables
+
+        The delay line buffers and attenuation tables of each tube are
+        replaced by views into the arena, so that the Tube methods
+        keep working on the same data. The pointers in the arena are
+        the current ones: they are copied back into the delay lines of
+        a tube only when the tube is accessed (see Tube._sync_ptrs),
+        and into the arena only after the delay lines were written
+        (see _load_ptrs)
+
+        (called by append_tube())
+        """
+        for tt in self.tubes:
+            tt._sync_ptrs()
+        ntubes = len(self.tubes)
+        width = max([len(tt.dlout.line) for tt in self.tubes] + [1])
+        natt = max([tt.delay+1 for tt in self.tubes] + [1])
+        self._arena = arena = _Arena(ntubes, width, natt, self.dtype)
+        self.bufs_in = arena.bufs_in
+        self.bufs_out = arena.bufs_out
+        self.ptrs_in = arena.state['ptr_in']
+        self.ptrs_out = arena.state['ptr_out']
+        self.delays = arena.state['delay']
+        self.masks = arena.state['mask']
+        self._prop_mults = arena.state['prop_mult']
+        # junction coefficients, one array per matrix element
+        self._c00 = arena.state['c00']
+        self._c01 = arena.state['c01']
+        self._c10 = arena.state['c10']
+        self._c11 = arena.state['c11']
+        # (s00, s01, s10, s11) of each junction as python floats
+        self._scat_coefs = [None]*ntubes
+        for ii, tt in enumerate(self.tubes):
+            line_len = len(tt.dlout.line)
+            self.bufs_in[ii, :line_len] = tt.dlin.line
+            self.bufs_out[ii, :line_len] = tt.dlout.line
+            self.delays[ii] = tt.delay
+            self.masks[ii] = tt.dlout.mask
+            self._prop_mults[ii] = tt.prop_mult
+            tt.dlin.line = self.bufs_in[ii, :line_len]
+            tt.dlout.line = self.bufs_out[ii, :line_len]
+            arena.att[ii, :tt.delay+1] = tt._pmults
+            tt._pmults = arena.att[ii, :tt.delay+1]
+        for ii in range(ntubes):
+            self._set_scat_coefs(ii)
+        # work space of get_sum_distribution, and the part of it for each tube
+        # (consecutive tubes share one point)
+        self._sum_buf = np.zeros(sum(tt.delay for tt in self.tubes)+1,
+                                 dtype=self.dtype)
+        self._sum_slices = []
+        pos = 0
+        for tt in self.tubes:
+            self._sum_slices.append(self._sum_buf[pos:pos+tt.delay+1])
+            pos += tt.delay
+        # the pointers of the delay lines are copied into the arena,
+        # which holds the current ones from now on
+        for ii, tt in enumerate(self.tubes):
+            tt._assembly = self
+            tt._index = ii
+            tt._kernel_ticks = 0
+            self.ptrs_in[ii] = tt.dlin.ptr
+            self.ptrs_out[ii] = tt.dlout.ptr
+        # ticks run by the kernels since the arena was built
+        self._kernel_ticks = 0
+        # whether the delay lines were written after the pointers
+        # were last copied into the arena
+        self._ptrs_stale = False
+        # kernel ticks when all the delay lines were last brought up to date
+        self._synced_ticks = 0
+
+    def _load_ptrs(self):
+        """
+        Copy the pointers of the delay lines of each tube into
+        ptrs_in and ptrs_out, after the delay lines were written
+        outside of the kernels
+        """
+        self._sync_tubes()
+        self.ptrs_in[:] = [tt.dlin.ptr for tt in self.tubes]
+        self.ptrs_out[:] = [tt.dlout.ptr for tt in self.tubes]
+        self._ptrs_stale = False
+
+    def _sync_tubes(self):
+        """
+        Bring the pointers of the delay lines of all tubes up to date
+        """
+        if self._synced_ticks != self._kernel_ticks:
+            for tt in self.tubes:
+                tt._sync_ptrs()
+            self._synced_ticks = self._kernel_ticks
+
+    def _store_ptrs(self, index):
+        """
+        Copy back the pointers of tube index from ptrs_in and ptrs_out
+        into its delay lines (see Tube._sync_ptrs)
+        """
+        tt = self.tubes[index]
+        nticks = self._kernel_ticks - tt._kernel_ticks
+        for dl, ptrs in ((tt.dlin, self.ptrs_in), (tt.dlout, self.ptrs_out)):
+            dl.ptr = int(ptrs[index])
+            dl.nticks += nticks
+        tt._kernel_ticks = self._kernel_ticks
+
+    def _set_scat_coefs(self, index):
+        """
+        Copy the scattering matrix at index into a tuple of python floats
+        used by scatter(), and into the junction coefficient arrays
+        used by the compiled kernels
+
+        The junction coefficients include the propagation losses of the
+        lines that feed the junction, so that samples read at the exit
+        of the lines do not need to be attenuated
+        """
+        scat = self._scats[index]
+        coefs = (float(scat[0, 0]), float(scat[0, 1]),
+                 float(scat[1, 0]), float(scat[1, 1]))
+        self._scat_coefs[index] = coefs
+        # outgoing wave from tube index, incoming wave from the next tube
+        # (nothing to attenuate for the value inserted at the end)
+        mult_out = self._prop_mults[index]
+        if index < len(self.tubes) - 1:
+            mult_in = self._prop_mults[index+1]
+        else:
+            mult_in = 1.
+        self._c00[index] = coefs[0]*mult_out
+        self._c01[index] = coefs[1]*mult_in
+        self._c10[index] = coefs[2]*mult_out
+        self._c11[index] = coefs[3]*mult_in
+
     def connect_tubes(self, index=-1):
         """
         Calculates the scattering matrices for between two tubes
@@ -240,13 +711,15 @@ class TubeAssembly(object):
         scl = 1/self.radii[index-1]**2
         newscat = np.array([[2*scr, scl-scr],
                             [scr-scl, 2*scl]])/(scr+scl)
-        self.scats[index-1] = newscat
+        self.set_scattering(index-1, newscat)
 
     def scatter(self, index, outgoing_val=0.0, incoming_val=0.0):
         """
         inserts outgoing (from left) value and incoming (from right)
         into the cattering junction and returns
 
+        Uses the matrix set by set_scattering() (or connect_tubes())
+
         Parameters
         ----------
 
@@ -255,12 +728,9 @@ class TubeAssembly(object):
         incoming : float
                   (into left) values
         """
-        scat = self.scats[index]
-        plout_refl = outgoing_val*scat[1, 0]
-        plout_trans = outgoing_val*scat[0, 0]
-        prin_trans = incoming_val*scat[1, 1]
-        prin_refl = incoming_val*scat[0, 1]
-        return prin_refl+plout_trans, prin_trans+plout_refl
+        s00, s01, s10, s11 = self._scat_coefs[index]
+        return (incoming_val*s01 + outgoing_val*s00,
+                incoming_val*s11 + outgoing_val*s10)
 
     def insert_values(self, val, ret_val=0.0):
         """
@@ -282,36 +752,198 @@ class TubeAssembly(object):
 
         outgoing value from the radiative end
         """
+        if not HAVE_NUMBA:
+            return self._insert_values_py(val, ret_val)
+        if self._ptrs_stale:
+            self._load_ptrs()
+        prout = _step(self.bufs_in, self.bufs_out, self.ptrs_in, self.ptrs_out,
+                      self.delays, self.masks,
+                      self._c00, self._c01, self._c10, self._c11,
+                      val, ret_val)
+        self._kernel_ticks += 1
+        return prout
+
+    def run(self, signal, ret=None, out=None):
+        """
+        Run the simulation for an entire input signal
+
+        Equivalent to calling insert_values for each sample of the
+        signal, but runs in a single call to the compiled kernel
+
+        Parameters
+        ----------
+        signal : array of floats
+                 New values into tube start
+        ret : array of floats
+              New values into tube end (zeros by default)
+        out : array of floats
+              if given, the outgoing values are written in this array
+
+        Returns
+        -------
+
+        array of outgoing values from the radiative end
+        """
+        signal = np.ascontiguousarray(signal, dtype=self.dtype)
+        if ret is None:
+            ret = np.zeros_like(signal)
+        else:
+            ret = np.ascontiguousarray(ret, dtype=self.dtype)
+        if out is None:
+            out = np.zeros_like(signal)
+        # the kernel does not check bounds
+        if signal.ndim != 1:
+            raise ValueError('signal must be a 1-D array, got shape {}'
+                             .format(signal.shape))
+        for name, arr in (('ret', ret), ('out', out)):
+            if arr.shape != signal.shape:
+                raise ValueError('{} must have the same shape as signal {}, '
+                                 'got {}'.format(name, signal.shape,
+                                                 arr.shape))
+        if self._ptrs_stale:
+            self._load_ptrs()
+        _run(self.bufs_in, self.bufs_out, self.ptrs_in, self.ptrs_out,
+             self.delays, self.masks,
+             self._c00, self._c01, self._c10, self._c11,
+             signal, ret, out)
+        self._kernel_ticks += len(signal)
+        return out
+
+    def insert_values_block(self, vals, ret_vals=None):
+        """
+        insert a block of values at the tube start, advancing
+        all the delay lines by one sample per value
+
+        Equivalent to calling insert_values for each value.
+        Does not need numba: samples are processed with numpy
+        in chunks shorter than the shortest tube, so that no
+        sample inserted during a chunk reaches a junction
+        within the same chunk.
+
+        Parameters
+        ----------
+        vals : array of floats
+               New values into tube start
+        ret_vals : array of floats
+                   New values into tube end (zeros by default)
+
+        Returns
+        -------
+
+        array of outgoing values from the radiative end
+        """
+        vals = np.asarray(vals, dtype=self.dtype)
+        if ret_vals is None:
+            ret_vals = np.zeros_like(vals)
+        else:
+            ret_vals = np.asarray(ret_vals, dtype=self.dtype)
+        out = np.zeros_like(vals)
+        # a sample takes lag ticks from entrance to exit of its line
+        # (see Tube.read_outgoing)
+        lags = ((self.delays - 2) & self.masks) + 1
+        blk_len = int(np.min(lags))
+        if self._ptrs_stale:
+            self._load_ptrs()
+        for start in range(0, len(vals), blk_len):
+            stop = min(start+blk_len, len(vals))
+            out[start:stop] = self._insert_chunk(vals[start:stop],
+                                                 ret_vals[start:stop])
+        self._kernel_ticks += len(vals)
+        return out
+
+    def _insert_chunk(self, vals, ret_vals):
+        """
+        Run one chunk of insert_values_block, all tubes at once
+
+        vals and ret_vals must be shorter than the time any sample
+        takes to cross a tube
+        """
+        nvals = len(vals)
+        rows = np.arange(len(self.tubes))[:, np.newaxis]
+        ticks = np.arange(nvals)
+        masks = self.masks[:, np.newaxis]
+        # exit samples over the chunk, one row per tube
+        exit_offs = ticks - self.delays[:, np.newaxis] + 2
+        # (not attenuated, losses are in the junction coefficients)
+        plout = self.bufs_out[rows, (self.ptrs_out[:, np.newaxis] +
+                                     exit_offs) & masks]
+        prin = np.empty_like(plout)
+        prin[:-1] = self.bufs_in[rows[1:], (self.ptrs_in[1:, np.newaxis] +
+                                            exit_offs[1:]) & masks[1:]]
+        prin[-1] = ret_vals
+        # all junctions at once
+        prout = (prin*self._c01[:, np.newaxis] +
+                 plout*self._c00[:, np.newaxis])
+        plin = (prin*self._c11[:, np.newaxis] +
+                plout*self._c10[:, np.newaxis])
+        pout_new = np.empty_like(prout)
+        pout_new[0] = vals
+        pout_new[1:] = prout[:-1]
+        # write both copies of each line (see DelayLine)
+        idx_in = (self.ptrs_in[:, np.newaxis] + 1 + ticks) & masks
+        idx_out = (self.ptrs_out[:, np.newaxis] + 1 + ticks) & masks
+        for offset in (0, masks + 1):
+            self.bufs_in[rows, idx_in + offset] = plin
+            self.bufs_out[rows, idx_out + offset] = pout_new
+        self.ptrs_in[:] = (self.ptrs_in + nvals) & self.masks
+        self.ptrs_out[:] = (self.ptrs_out + nvals) & self.masks
+        return prout[-1]
+
+    def _insert_values_py(self, val, ret_val=0.0):
+        """
+        Pure python version of insert_values,
+        used when numba is not available
+        """
         # insert in first tube
         #self.tubes[0].insert_outgoing_sample(val)
+        # the delay lines are brought up to date once, then used directly
+        self._sync_tubes()
+        self._ptrs_stale = True
         # propagate outwards
+        tubes = self.tubes
+        scatter = self.scatter
         prev_prout = val
-        for ii, tube in enumerate(self.tubes[:-1]):
-            plout = self.tubes[ii].read_outgoing()
-            prin = self.tubes[ii+1].read_incoming()
-            prout, plin = self.scatter(ii, plout, prin)
-            self.tubes[ii].insert_incoming_sample(plin)
-            self.tubes[ii].insert_outgoing_sample(prev_prout)
+        plout = tubes[0]._read_both_exit()[0]
+        for ii in range(len(tubes)-1):
+            # both exits of the next tube are read before it is advanced
+            plout_next, prin = tubes[ii+1]._read_both_exit()
+            prout, plin = scatter(ii, plout, prin)
+            tube = tubes[ii]
+            tube.dlin.insert_sample(plin)
+            tube.dlout.insert_sample(prev_prout)
             prev_prout = prout
+            plout = plout_next
         # last element
-        plout = self.tubes[-1].read_outgoing()
         prin = ret_val
-        prout, plin = self.scatter(len(self.scats)-1, plout, prin)
-        self.tubes[-1].insert_incoming_sample(plin)
-        self.tubes[-1].insert_outgoing_sample(prev_prout)
+        prout, plin = scatter(-1, plout, prin)
+        tube = tubes[-1]
+        tube.dlin.insert_sample(plin)
+        tube.dlout.insert_sample(prev_prout)
 
         return prout
 
-    def get_sum_distribution(self):
+    def get_sum_distribution(self, out=None):
         """
         Returns a vector with sum (pressure) along the entire tube
-        """
-        ps = np.zeros(sum(tt.delay for tt in self.tubes)+1)
-        pos = 0
-        for tt in self.tubes:
-            ps[pos:pos+tt.delay+1] += tt.get_sum_distribution()
-            pos += tt.delay
-        return ps
+
+        Parameters
+        ----------
+        out : array of floats
+              if given, the vector is written in this array
+              (of length total delay + 1) and no new array is allocated
+
+        Returns
+        -------
+        a new vector, or out if given
+        """
+        ps = self._sum_buf
+        ps.fill(0.)
+        for tt, tube_ps in zip(self.tubes, self._sum_slices):
+            tt.write_sum_distribution(tube_ps)
+        if out is None:
+            return ps.copy()
+        out[:] = ps
+        return out
 
     def get_incoming_pressure_at_start(self):
         """
@@ -1,5 +1,7 @@
 import unittest 
 
+import numpy as np
+
 from selfosc.delay_lines import DelayLine
 
 class testDelayLine(unittest.TestCase):
@@ -15,6 +17,32 @@ class testDelayLine(unittest.TestCase):
         for ii in range(n_samp):
             self.assertEqual(dl.read_delay(ii), dldump[ii])
 
+    def test_dump_line_into_array(self):
+        n_samp = 10
+        dl = DelayLine(n_samp)
+        out = np.zeros(n_samp+1)
+        for ii in range(3*n_samp):
+            dl.insert_sample(ii)
+            dldump = dl.dump_line(out=out)
+            self.assertIs(dldump, out)
+            for jj in range(n_samp+1):
+                self.assertEqual(dl.read_delay(jj), out[jj])
+
+    def test_dump_line_too_long(self):
+        dl = DelayLine(8, extra=0)
+        self.assertEqual(len(dl.dump_line(n=8)), 8)
+        with self.assertRaises(ValueError):
+            dl.dump_line(n=9)
+        with self.assertRaises(ValueError):
+            dl.dump_line(out=np.zeros(9))
+
+    def test_buffer_is_not_copied(self):
+        dl = DelayLine(4)
+        buf = dl.buffer
+        dl.insert_sample(1.)
+        self.assertEqual(buf[dl.ptr], 1.)
+        self.assertEqual(buf[dl.ptr+dl.n_samp], 1.)
+
     def test_delay_is_right(self):
         n_samp = 3
         dl = DelayLine(n_samp)
@@ -36,6 +64,36 @@ class testDelayLine(unittest.TestCase):
             self.assertEqual(dl.read_delay(0), sampl_count+0.)
             sampl_count += 1
 
+    def test_insert_block(self):
+        n_samp = 5
+        dl_smpl = DelayLine(n_samp)
+        dl_blk = DelayLine(n_samp)
+        sampl_count = 0
+        for blk_len in [3, 7, 1, 20, 4]:
+            blk = np.arange(sampl_count, sampl_count+blk_len)
+            for val in blk:
+                dl_smpl.insert_sample(val)
+            dl_blk.insert_block(blk)
+            sampl_count += blk_len
+            self.assertEqual(dl_blk.ptr, dl_smpl.ptr)
+            np.testing.assert_array_equal(dl_blk.line, dl_smpl.line)
+            np.testing.assert_array_equal(dl_blk.line[:dl_blk.n_samp],
+                                          dl_blk.line[dl_blk.n_samp:])
+
+    def test_read_block_delay(self):
+        n_samp = 5
+        dl = DelayLine(n_samp)
+        dl_ref = DelayLine(n_samp)
+        for ii in range(13):
+            dl.insert_sample(ii)
+            dl_ref.insert_sample(ii)
+        for delay in range(n_samp+1):
+            blk = dl.read_block_delay(delay, delay+1)
+            for ii in range(delay+1):
+                self.assertEqual(blk[ii], dl_ref.read_delay(delay))
+                dl_ref.insert_sample(-1)
+            dl.insert_block(-np.ones(delay+1))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,23 @@
 import unittest 
 
+import numpy as np
+
 from selfosc.simple_delay_tubes import TubeAssembly
 
+# (delay, radius, losses) of each tube
+GEOMETRY = [(5, 1.0, 0.01), (9, 0.7, 0.002), (3, 1.3, 0.)]
+# insert_values_block processes chunks of (shortest delay - 1) samples:
+# a delay=2 tube gives chunks of 1 sample, the others longer chunks
+BLOCK_GEOMETRIES = [GEOMETRY,
+                    [(5, 1.0, 0.01), (2, 0.5, 0.), (4, 0.8, 0.001)],
+                    [(7, 1.0, 0.), (9, 0.6, 0.01)]]
+
+def make_assembly(geometry=GEOMETRY):
+    ta=TubeAssembly()
+    for delay, radius, losses in geometry:
+        ta.append_tube(delay=delay, radius=radius, losses=losses)
+    return ta
+
 class testDelayLine(unittest.TestCase):
     def test_tube_assembly_create(self):
         ta=TubeAssembly()
@@ -15,10 +31,157 @@ class testDelayLine(unittest.TestCase):
         for ii in range(3*delay):
             inval = ta.get_incoming_pressure_at_start()
             ta.insert_values(0.0)
-            if inval == -val:
+            if np.isclose(inval, -val):
                 print('Value arrived at sample {} (tub delay={})'.format(ii,delay))
             else:
                 self.assertEqual(inval,0.0)
 
+    def test_short_tube_rejected(self):
+        ta=TubeAssembly()
+        for delay in (0, 1):
+            with self.assertRaises(ValueError):
+                ta.append_tube(delay=delay)
+        self.assertEqual(len(ta.tubes), 0)
+        ta.append_tube()
+        self.assertEqual(ta.tubes[0].delay, 2)
+
+    def test_custom_termination(self):
+        for method in ('insert_values', '_insert_values_py'):
+            ta=TubeAssembly()
+            ta.append_tube(delay=3, radius=1.0)
+            ta.set_scattering(-1, [[.3, 1.], [.5, 0.]])
+            insert_values = getattr(ta, method)
+            insert_values(1.0)
+            inval = []
+            for ii in range(9):
+                inval.append(ta.get_incoming_pressure_at_start())
+                insert_values(0.0)
+            np.testing.assert_allclose(sorted(inval), [0.]*8 + [.5])
+
+    def test_scats_assignment(self):
+        ta = make_assembly()
+        with self.assertRaises(ValueError):
+            ta.scats[-1][0, 0] = 1.
+        ta.scats[-1] = [[.3, 1.], [.5, 0.]]
+        np.testing.assert_array_equal(ta.scats[2], [[.3, 1.], [.5, 0.]])
+        self.assertEqual(len(ta.scats), 3)
+        # same output as with set_scattering
+        ta_set = make_assembly()
+        ta_set.set_scattering(-1, [[.3, 1.], [.5, 0.]])
+        vals = np.random.RandomState(6).randn(50)
+        np.testing.assert_array_equal(ta.run(vals), ta_set.run(vals))
+
+    def test_arena_alignment(self):
+        for dtype in (np.float32, np.float64):
+            ta = TubeAssembly(dtype=dtype)
+            for delay, radius, losses in GEOMETRY:
+                ta.append_tube(delay=delay, radius=radius, losses=losses)
+                arena = ta._arena
+                # one cache line per tube record
+                self.assertEqual(arena.state.strides, (64,))
+                for part in (arena.state, arena.bufs_in, arena.bufs_out,
+                             arena.att):
+                    self.assertEqual(part.ctypes.data % 64, 0)
+                # and every row starts on a cache line
+                for part in (arena.bufs_in, arena.bufs_out, arena.att):
+                    self.assertEqual(part.strides[0] % 64, 0)
+
+    def check_block_method(self, method, geometry, nvals):
+        """
+        check that a block method gives the same output and final state
+        as calling insert_values for every sample
+        """
+        rng = np.random.RandomState(0)
+        vals = rng.randn(nvals)
+        ret_vals = rng.randn(nvals)
+        ta_smpl = make_assembly(geometry)
+        out_smpl = [ta_smpl.insert_values(val, ret_val)
+                    for val, ret_val in zip(vals, ret_vals)]
+        ta_blk = make_assembly(geometry)
+        out_blk = getattr(ta_blk, method)(vals, ret_vals)
+        np.testing.assert_allclose(out_blk, out_smpl, rtol=1e-5, atol=1e-6)
+        for ii in range(sum(delay for delay, _, _ in geometry)):
+            self.assertAlmostEqual(ta_blk.get_sum_at_pos(ii),
+                                   ta_smpl.get_sum_at_pos(ii), places=5)
+
+    def test_block_methods_match_insert_values(self):
+        # 101 samples is not a multiple of the longer chunk lengths (2, 6)
+        for method in ('run', 'insert_values_block'):
+            for geometry in BLOCK_GEOMETRIES:
+                with self.subTest(method=method, geometry=geometry):
+                    self.check_block_method(method, geometry, 101)
+
+    def test_run_into_array(self):
+        vals = np.random.RandomState(1).randn(100)
+        ta_smpl = make_assembly()
+        out_smpl = [ta_smpl.insert_values(val) for val in vals]
+        ta_run = make_assembly()
+        out = np.zeros(100, dtype=ta_run.dtype)
+        out_run = ta_run.run(vals, out=out)
+        self.assertIs(out_run, out)
+        np.testing.assert_allclose(out, out_smpl, rtol=1e-5)
+
+    def test_run_checks_lengths(self):
+        ta = make_assembly()
+        with self.assertRaises(ValueError):
+            ta.run(np.zeros(10), np.ones(3))
+        with self.assertRaises(ValueError):
+            ta.run(np.ones(1000), out=np.zeros(3, dtype=ta.dtype))
+        with self.assertRaises(ValueError):
+            ta.run(np.zeros((10, 2)))
+
+    def test_python_loop_matches_kernel(self):
+        vals = np.random.RandomState(2).randn(100)
+        ta_py = make_assembly()
+        out_py = [ta_py._insert_values_py(val) for val in vals]
+        ta_blk = make_assembly()
+        out_blk = ta_blk.run(vals)
+        np.testing.assert_allclose(out_blk, out_py, rtol=1e-5)
+
+    def test_mixed_kernel_and_python_loop(self):
+        vals = np.random.RandomState(5).randn(60)
+        ta_py = make_assembly()
+        out_py = [ta_py._insert_values_py(val) for val in vals]
+        ta_mix = make_assembly()
+        out_mix = list(ta_mix.run(vals[:20]))
+        out_mix += [ta_mix._insert_values_py(val) for val in vals[20:30]]
+        out_mix += [ta_mix.insert_values(val) for val in vals[30:40]]
+        out_mix += list(ta_mix.insert_values_block(vals[40:]))
+        np.testing.assert_allclose(out_mix, out_py, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(ta_mix.get_sum_distribution(),
+                                   ta_py.get_sum_distribution(),
+                                   rtol=1e-5, atol=1e-6)
+        for tt_mix, tt_py in zip(ta_mix.tubes, ta_py.tubes):
+            for dl_mix, dl_py in ((tt_mix.dlin, tt_py.dlin),
+                                  (tt_mix.dlout, tt_py.dlout)):
+                self.assertEqual(dl_mix.ptr, dl_py.ptr)
+                self.assertEqual(dl_mix.nticks, dl_py.nticks)
+
+    def test_append_keeps_state(self):
+        ta = make_assembly()
+        ta.run(np.random.RandomState(3).randn(50))
+        sums = [ta.get_sum_at_pos(ii) for ii in range(17)]
+        ta.append_tube(delay=12, radius=0.5)
+        for ii in range(17):
+            self.assertEqual(ta.get_sum_at_pos(ii), sums[ii])
+
+    def test_sum_distribution(self):
+        ta = make_assembly()
+        rng = np.random.RandomState(4)
+        ta.run(rng.randn(50), rng.randn(50))
+        ps = ta.get_sum_distribution()
+        self.assertEqual(len(ps), 18)
+        self.assertIsNot(ta.get_sum_distribution(), ps)
+        out = np.zeros(18, dtype=ta.dtype)
+        self.assertIs(ta.get_sum_distribution(out=out), out)
+        np.testing.assert_array_equal(out, ps)
+        for tt in ta.tubes:
+            for ii in range(tt.delay+1):
+                self.assertAlmostEqual(tt.get_sum_distribution()[ii],
+                                       tt.get_sum_at_pos(ii), places=5)
+        # interior points of the first tube
+        for ii in range(1, 5):
+            self.assertAlmostEqual(ps[ii], ta.get_sum_at_pos(ii), places=5)
+
 if __name__ == '__main__':
     unittest.main()